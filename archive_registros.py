@@ -0,0 +1,35 @@
+# archive_registros.py
+"""
+Mueve a Parquet (ARCHIVE_DIR) los registros con inference_date anterior al corte
+y los borra de la BD. Los endpoints de listado/exportación los siguen leyendo.
+
+Variables de entorno:
+  DATABASE_URL        -> misma que usa la API
+  ARCHIVE_DIR         -> OBLIGATORIA: ruta absoluta en un volumen persistente montado
+                         también en la API (el disco del contenedor es efímero)
+  ARCHIVE_AFTER_DAYS  -> antigüedad mínima en días (por defecto 365)
+  ARCHIVE_CUTOFF      -> opcional, fecha de corte explícita YYYY-MM-DD (ignora ARCHIVE_AFTER_DAYS)
+"""
+
+import os
+from datetime import date, timedelta
+
+if not os.getenv("ARCHIVE_DIR"):
+    raise SystemExit("Falta ARCHIVE_DIR (ruta absoluta en un volumen persistente compartido con la API).")
+
+from database import SessionLocal
+from auth import archive
+
+def main():
+    corte_raw = os.getenv("ARCHIVE_CUTOFF")
+    corte = date.fromisoformat(corte_raw) if corte_raw else date.today() - timedelta(days=archive.ARCHIVE_AFTER_DAYS)
+    print(f"[INFO] Archivando registros con inference_date < {corte} en {archive.ARCHIVE_DIR}")
+
+    with SessionLocal() as db:
+        total = archive.archivar_registros(
+            db, corte, on_mes=lambda mes, n: print(f"[INFO] {mes}: {n} registros archivados")
+        )
+    print(f"[DONE] Registros archivados: {total}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+# auth/archive.py
+"""
+Archivo frío de la tabla 'registros' en Parquet (disco local).
+
+Layout en ARCHIVE_DIR:
+  registros/anio_mes=YYYY-MM/part-<uuid>.parquet   -> columnas del registro SIN la imagen
+  registros/_corte                                 -> fecha de corte (todo lo anterior puede estar archivado)
+  imagenes/YYYY-MM/<key>.b64                       -> base64 de la imagen, tal cual venía en la BD
+
+En la BD queda la tabla 'registros_archivados' (key, inference_date) con las keys
+movidas, para comprobar duplicados sin abrir ningún Parquet.
+
+IMPORTANTE: el job borra de la BD lo que archiva, así que ARCHIVE_DIR debe ser
+una ruta ABSOLUTA en un volumen persistente montado tanto en la API como en el
+proceso que corre el job. El disco de los contenedores de Render/Railway es
+efímero: sin volumen, un redeploy borra el archivo y un job en otro contenedor
+escribe donde la API nunca lee. Sin ARCHIVE_DIR el archivo queda desactivado
+(la API solo lee la BD y el job se niega a correr).
+
+- El job archiva un mes por vez: un Parquet por mes (las partes previas del mes
+  se compactan en el nuevo) y el mes se borra de la BD solo después de cerrarlo.
+- Las consultas con rango de fechas solo leen las particiones (meses) que tocan.
+- Las lecturas piden solo las columnas necesarias (poda de columnas de Parquet).
+- Si el job se corta entre escribir el Parquet y borrar de la BD, puede haber
+  duplicados: al leer se deduplica por 'key' y la BD siempre gana.
+"""
+
+import os
+import uuid
+from datetime import date
+from typing import Optional, Iterable, Iterator, List, Dict, Any, Callable
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from auth.models import Registro, RegistroArchivado
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+
+if ARCHIVE_DIR and not os.path.isabs(ARCHIVE_DIR):
+    raise RuntimeError(
+        f"ARCHIVE_DIR debe ser una ruta absoluta en un volumen persistente compartido con la API (es '{ARCHIVE_DIR}')."
+    )
+
+PARTICION = "anio_mes"
+FILAS_POR_GRUPO = 10000   # filas por row group de Parquet
+LOTE_BD = 500             # filas por lote al leer/borrar en la BD
+
+# Mismas columnas que Registro, salvo 'image' (va aparte, en imagenes/)
+ESQUEMA = pa.schema([
+    ("key", pa.string()),
+    ("user_id", pa.int64()),
+    ("inference_date", pa.date32()),
+    ("birth_date", pa.date32()),
+    ("gender", pa.string()),
+    ("city", pa.string()),
+    ("parish", pa.string()),
+    ("canton", pa.string()),
+    ("precision", pa.float64()),
+    ("resultados", pa.string()),
+    ("feedback", pa.string()),
+])
+COLUMNAS = ESQUEMA.names
+
+
+def _registros_dir() -> str:
+    return os.path.join(ARCHIVE_DIR, "registros")
+
+def _imagenes_dir() -> str:
+    return os.path.join(ARCHIVE_DIR, "imagenes")
+
+def _corte_path() -> str:
+    return os.path.join(_registros_dir(), "_corte")
+
+def _anio_mes(d: date) -> str:
+    return d.strftime("%Y-%m")
+
+def _imagen_path(key: str, inference_date: date) -> str:
+    # quote() para que cualquier 'key' sea un nombre de archivo válido
+    return os.path.join(_imagenes_dir(), _anio_mes(inference_date), quote(key, safe="") + ".b64")
+
+def _escribir_atomico(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Prefijo "." -> pyarrow.dataset ignora el temporal si se queda a medias
+    tmp = os.path.join(os.path.dirname(path), "." + os.path.basename(path) + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+# --- Fecha de corte ---
+def leer_corte() -> Optional[date]:
+    if not ARCHIVE_DIR:
+        return None
+    try:
+        with open(_corte_path(), "r", encoding="utf-8") as f:
+            return date.fromisoformat(f.read().strip())
+    except FileNotFoundError:
+        return None
+
+def _guardar_corte(corte: date):
+    actual = leer_corte()
+    if actual is not None and actual >= corte:
+        return
+    _escribir_atomico(_corte_path(), corte.isoformat().encode("utf-8"))
+
+def abarca_archivo(desde: Optional[date]) -> bool:
+    """True si una consulta que empieza en 'desde' (None = sin límite) toca fechas archivadas."""
+    corte = leer_corte()
+    return corte is not None and (desde is None or desde < corte)
+
+
+# --- Escritura (job de archivado) ---
+def _siguiente_mes(d: date) -> date:
+    return date(d.year + (d.month == 12), d.month % 12 + 1, 1)
+
+def _escribir_mes(db: Session, inicio: date, fin: date) -> List[Dict[str, Any]]:
+    """
+    Escribe en un único Parquet los registros con inicio <= inference_date < fin
+    (un mes) junto con las partes que ya tenía esa partición, y reemplaza esas
+    partes. Devuelve [{key, inference_date}] de los registros nuevos; la BD no se toca.
+    """
+    mes = _anio_mes(inicio)
+    mes_dir = os.path.join(_registros_dir(), f"{PARTICION}={mes}")
+    previas = sorted(
+        os.path.join(mes_dir, f) for f in (os.listdir(mes_dir) if os.path.isdir(mes_dir) else [])
+        if f.startswith("part-") and f.endswith(".parquet")
+    )
+
+    filas = (
+        db.query(*[getattr(Registro, c) for c in COLUMNAS], Registro.image)
+        .filter(Registro.inference_date >= inicio, Registro.inference_date < fin)
+        .order_by(Registro.inference_date, Registro.key)
+        .yield_per(LOTE_BD)
+    )
+
+    nuevos: List[Dict[str, Any]] = []
+    os.makedirs(mes_dir, exist_ok=True)
+    destino = os.path.join(mes_dir, f"part-{uuid.uuid4().hex}.parquet")
+    tmp = os.path.join(mes_dir, "." + os.path.basename(destino) + ".tmp")
+    buffer: List[Dict[str, Any]] = []
+    with pq.ParquetWriter(tmp, ESQUEMA, compression="zstd") as writer:
+        for fila in filas:
+            # Primero la imagen, luego el Parquet: un registro visible en el
+            # archivo siempre tiene su imagen disponible.
+            if fila.image is not None:
+                _escribir_atomico(_imagen_path(fila.key, fila.inference_date), fila.image.encode("utf-8"))
+            buffer.append({c: getattr(fila, c) for c in COLUMNAS})
+            nuevos.append({"key": fila.key, "inference_date": fila.inference_date})
+            if len(buffer) >= FILAS_POR_GRUPO:
+                writer.write_table(pa.Table.from_pylist(buffer, schema=ESQUEMA))
+                buffer = []
+        if buffer:
+            writer.write_table(pa.Table.from_pylist(buffer, schema=ESQUEMA))
+
+        # Compacta: lo ya archivado del mes va al mismo archivo (la BD gana si se repite)
+        if previas:
+            keys_nuevas = pa.array([n["key"] for n in nuevos], type=pa.string())
+            anteriores = ds.dataset(previas, format="parquet", schema=ESQUEMA).to_table(
+                filter=~ds.field("key").isin(keys_nuevas)
+            )
+            writer.write_table(anteriores, row_group_size=FILAS_POR_GRUPO)
+
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, destino)
+    # Si se corta aquí quedan filas repetidas entre partes; la lectura deduplica por key
+    for path in previas:
+        os.remove(path)
+    return nuevos
+
+def archivar_registros(
+    db: Session,
+    corte: date,
+    on_mes: Optional[Callable[[str, int], None]] = None,
+) -> int:
+    """
+    Mueve a Parquet los registros con inference_date < corte, un mes por vez, y
+    los borra de la BD (dejando su key en registros_archivados). Cada mes se
+    borra solo después de cerrar su Parquet; 'on_mes' recibe el mes y cuántos
+    registros se movieron.
+    """
+    if not ARCHIVE_DIR:
+        raise RuntimeError("ARCHIVE_DIR no está configurado; no se archiva nada.")
+
+    # El corte se guarda ANTES de borrar nada: así las lecturas ya consultan el
+    # archivo aunque el job se corte a mitad de camino.
+    _guardar_corte(corte)
+
+    total = 0
+    while True:
+        primero = db.query(func.min(Registro.inference_date)).filter(Registro.inference_date < corte).scalar()
+        if primero is None:
+            break
+        inicio = primero.replace(day=1)
+        nuevos = _escribir_mes(db, inicio, min(_siguiente_mes(inicio), corte))
+
+        for i in range(0, len(nuevos), LOTE_BD):
+            parte = nuevos[i:i + LOTE_BD]
+            db.execute(insert(RegistroArchivado), parte)
+            db.query(Registro).filter(Registro.key.in_([n["key"] for n in parte])).delete(synchronize_session=False)
+        db.commit()
+
+        total += len(nuevos)
+        if on_mes is not None:
+            on_mes(_anio_mes(inicio), len(nuevos))
+    return total
+
+
+# --- Lectura ---
+def _meses(desde: Optional[date], hasta: Optional[date]) -> List[str]:
+    """Particiones existentes dentro del rango, en orden cronológico."""
+    base = _registros_dir()
+    if not ARCHIVE_DIR or not os.path.isdir(base):
+        return []
+    prefijo = f"{PARTICION}="
+    meses = sorted(d[len(prefijo):] for d in os.listdir(base) if d.startswith(prefijo))
+    if desde is not None:
+        meses = [m for m in meses if m >= _anio_mes(desde)]
+    if hasta is not None:
+        meses = [m for m in meses if m <= _anio_mes(hasta)]
+    return meses
+
+def iterar_archivo(
+    columnas: Optional[Iterable[str]] = None,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    user_id: Optional[int] = None,
+    excluir_keys: Iterable[str] = (),
+) -> Iterator[Dict[str, Any]]:
+    """
+    Recorre registros archivados (sin imagen) mes a mes, ordenados por
+    (inference_date, key). 'columnas' limita lo que se lee del Parquet; el rango
+    de fechas poda particiones y el resto se filtra por fila.
+    """
+    columnas = list(columnas) if columnas is not None else list(COLUMNAS)
+    desconocidas = set(columnas) - set(COLUMNAS)
+    if desconocidas:
+        raise ValueError(f"Columnas no archivadas: {sorted(desconocidas)}")
+    # 'key' e 'inference_date' hacen falta para deduplicar y ordenar aunque no se pidan
+    leer = list(dict.fromkeys(["key", "inference_date"] + columnas))
+
+    filtro = None
+    def _y(expr):
+        return expr if filtro is None else filtro & expr
+    if desde is not None:
+        filtro = _y(ds.field("inference_date") >= desde)
+    if hasta is not None:
+        filtro = _y(ds.field("inference_date") <= hasta)
+    if user_id is not None:
+        filtro = _y(ds.field("user_id") == user_id)
+
+    vistos = set(excluir_keys)
+    for mes in _meses(desde, hasta):
+        dataset = ds.dataset(os.path.join(_registros_dir(), f"{PARTICION}={mes}"), format="parquet", schema=ESQUEMA)
+        tabla = dataset.to_table(columns=leer, filter=filtro)
+        tabla = tabla.sort_by([("inference_date", "ascending"), ("key", "ascending")])
+        for batch in tabla.to_batches():
+            for fila in batch.to_pylist():
+                if fila["key"] in vistos:
+                    continue
+                vistos.add(fila["key"])
+                yield {c: fila[c] for c in columnas}
+
+def leer_archivo(
+    columnas: Optional[Iterable[str]] = None,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    user_id: Optional[int] = None,
+    excluir_keys: Iterable[str] = (),
+) -> List[Dict[str, Any]]:
+    return list(iterar_archivo(columnas, desde, hasta, user_id, excluir_keys=excluir_keys))
+
+def existe_en_archivo(db: Session, key: str) -> bool:
+    # Búsqueda por PK en el índice, sin abrir ningún Parquet
+    return db.query(RegistroArchivado.key).filter(RegistroArchivado.key == key).first() is not None
+
+def leer_imagen(key: str, inference_date: date) -> Optional[str]:
+    try:
+        with open(_imagen_path(key, inference_date), "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def leer_registros_archivados(user_id: int, excluir_keys: Iterable[str] = ()) -> List[Dict[str, Any]]:
+    """Registros archivados completos (con imagen), con la misma forma que devuelve la BD."""
+    filas = leer_archivo(user_id=user_id, excluir_keys=excluir_keys)
+    for fila in filas:
+        fila["image"] = leer_imagen(fila["key"], fila["inference_date"])
+    return filas
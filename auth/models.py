@@ -27,4 +27,12 @@ class Registro(Base):
     feedback = Column(Text)
     image = Column(Text)        # base64 de la imagen
 
-    user = relationship("User")
\ No newline at end of file
+    user = relationship("User")
+
+
+class RegistroArchivado(Base):
+    # Índice de los registros movidos a Parquet (lo llena archive_registros.py)
+    __tablename__ = "registros_archivados"
+
+    key = Column(String, primary_key=True, index=True)
+    inference_date = Column(Date)
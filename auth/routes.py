@@ -1,10 +1,15 @@
 # auth/routes.py
+import csv
+import heapq
+import io
+from itertools import groupby
+from datetime import date
+from typing import Optional
+
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
-# Quita esta línea (ya no se usa):
-# from database import SessionLocal
-
 from .models import User, Registro
 from .schemas import UserLogin, RegistroCreate
 
@@ -19,6 +24,8 @@ from auth.auth_utils import (
 )
 
 from auth.schemas import RadiologoCreate, RadiologoOut, RadiologoUpdate
+from auth import archive
+from database import SessionLocal
 
 router = APIRouter()
 
@@ -78,7 +85,7 @@ def delete_radiologo(id: int, db: Session = Depends(get_db), current_user: User
 @router.post("/guardar_registro")
 def guardar_registro(data: RegistroCreate, db: Session = Depends(get_db), current_user=Depends(get_current_user)):
     existe = db.query(Registro).filter_by(key=data.key).first()
-    if existe:
+    if existe or archive.existe_en_archivo(db, data.key):
         raise HTTPException(status_code=400, detail="Registro ya existe")
 
     nuevo = Registro(
@@ -99,12 +106,94 @@ def guardar_registro(data: RegistroCreate, db: Session = Depends(get_db), curren
     db.commit()
     return {"msg": "Registro guardado"}
 
+def _registro_a_dict(r: Registro) -> dict:
+    return {c.name: getattr(r, c.name) for c in Registro.__table__.columns}
+
+def _con_archivo(registros: list, user_id: int) -> list:
+    # Lectura transparente: agrega los registros ya movidos a Parquet (la BD gana si hay duplicados)
+    if not archive.abarca_archivo(None):
+        return registros
+    filas = [_registro_a_dict(r) for r in registros]
+    filas += archive.leer_registros_archivados(user_id, excluir_keys=[f["key"] for f in filas])
+    return filas
+
 @router.get("/mis_registros")
 def mis_registros(db: Session = Depends(get_db), current_user=Depends(get_current_user)):
     registros = db.query(Registro).filter_by(user_id=current_user.id).all()
-    return registros
+    return _con_archivo(registros, current_user.id)
 
 @router.get("/registros_por_radiologo/{radiologo_id}")
 def registros_por_radiologo(radiologo_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
-    registros = db.query(Registro).filter(Registro.user_id == radiologo_id).order_by(Registro.inference_date.desc()).all()
-    return registros
+    registros = db.query(Registro).filter(Registro.user_id == radiologo_id).order_by(Registro.inference_date.desc().nulls_first()).all()
+    if not archive.abarca_archivo(None):
+        return registros
+    filas = _con_archivo(registros, radiologo_id)
+    # Mismo orden que Postgres con DESC: los inference_date nulos (solo en BD) van primero
+    filas.sort(key=lambda f: (f["inference_date"] is None, f["inference_date"] or date.min), reverse=True)
+    return filas
+
+## Exportación CSV (sin imagen). 'columnas' separadas por coma, p. ej. "inference_date,precision"
+@router.get("/exportar_registros")
+def exportar_registros(
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    columnas: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user),
+):
+    cols = [c.strip() for c in columnas.split(",") if c.strip()] if columnas else list(archive.COLUMNAS)
+    invalidas = [c for c in cols if c not in archive.COLUMNAS]
+    if invalidas:
+        raise HTTPException(status_code=400, detail=f"Columnas no exportables: {', '.join(invalidas)}")
+
+    leer = list(dict.fromkeys(["key", "inference_date"] + cols))
+
+    def _fecha(fila):
+        return (fila["inference_date"] is None, fila["inference_date"] or date.min)
+
+    def _filas():
+        # Sesión propia: la de get_db se cierra antes de que se consuma el stream.
+        with SessionLocal() as s:
+            q = s.query(*[getattr(Registro, c) for c in leer])
+            if desde is not None:
+                q = q.filter(Registro.inference_date >= desde)
+            if hasta is not None:
+                q = q.filter(Registro.inference_date <= hasta)
+            # La consulta se ejecuta ANTES de leer el corte: lo que el job borre
+            # después sigue en este cursor, y lo que borró antes ya está en Parquet.
+            cursor = iter(q.order_by(Registro.inference_date.asc().nulls_last(), Registro.key).yield_per(500))
+            en_bd = ((0, row._asdict()) for row in cursor)
+
+            if not archive.abarca_archivo(desde):
+                for _, fila in en_bd:
+                    yield fila
+                return
+
+            # Mezcla por fecha (nulos al final); dentro de cada día se ordena por key
+            # y, si un registro está en la BD y en el archivo, gana la BD (origen 0).
+            archivados = ((1, f) for f in archive.iterar_archivo(columnas=leer, desde=desde, hasta=hasta))
+            mezcla = heapq.merge(en_bd, archivados, key=lambda t: _fecha(t[1]))
+            for _, dia in groupby(mezcla, key=lambda t: _fecha(t[1])):
+                anterior = None
+                for _, fila in sorted(dia, key=lambda t: (t[1]["key"], t[0])):
+                    if fila["key"] != anterior:
+                        anterior = fila["key"]
+                        yield fila
+
+    def _csv():
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=cols, extrasaction="ignore")
+        writer.writeheader()
+        for n, fila in enumerate(_filas(), 1):
+            writer.writerow(fila)
+            if n % 500 == 0:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate(0)
+        yield buf.getvalue()
+
+    return StreamingResponse(
+        _csv(),
+        media_type="text/csv",
+        headers={"Content-Disposition": "attachment; filename=registros.csv"},
+    )
@@ -0,0 +1,3 @@
+# conftest.py
+# Vacío a propósito: hace que pytest agregue la raíz del repo al sys.path
+# para poder importar 'auth' y 'database' desde tests/.
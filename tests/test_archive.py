@@ -0,0 +1,280 @@
+# tests/test_archive.py
+import csv
+import io
+import os
+from datetime import date
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from auth.models import User, Registro, RegistroArchivado
+from auth import archive, auth_utils, routes
+
+CORTE = date(2024, 1, 1)
+
+# key -> (user_id, inference_date)
+FECHAS = {
+    "c9": (1, date(2023, 1, 5)),
+    "a1": (1, date(2023, 2, 7)),
+    "b5": (2, date(2023, 2, 7)),
+    "d2": (2, date(2023, 2, 20)),
+    "e7": (1, date(2023, 11, 30)),
+    "f3": (1, date(2025, 1, 1)),
+    "g0": (1, None),
+}
+ARCHIVABLES = sorted(k for k, (_, f) in FECHAS.items() if f is not None and f < CORTE)
+
+
+def _registro(key, user_id, fecha, feedback="bd"):
+    return Registro(
+        key=key, user_id=user_id, inference_date=fecha, birth_date=date(1990, 1, 1),
+        gender="F", city="Quito", parish="p", canton="c", precision=0.9,
+        resultados="{}", feedback=feedback, image=f"img-{key}",
+    )
+
+
+@pytest.fixture
+def Session(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    # exportar_registros abre su propia sesión
+    monkeypatch.setattr(routes, "SessionLocal", Session)
+    with Session() as s:
+        s.add_all([User(id=1, username="r1", role="radiologo"), User(id=2, username="r2", role="radiologo")])
+        s.add_all([_registro(k, u, f) for k, (u, f) in FECHAS.items()])
+        s.commit()
+    return Session
+
+
+@pytest.fixture
+def db(Session):
+    with Session() as s:
+        yield s
+
+
+@pytest.fixture
+def client(Session):
+    app = FastAPI()
+    app.include_router(routes.router)
+
+    def get_db():
+        with Session() as s:
+            yield s
+
+    app.dependency_overrides[auth_utils.get_db] = get_db
+    app.dependency_overrides[auth_utils.get_current_user] = lambda: User(id=1, username="r1", role="radiologo")
+    app.dependency_overrides[auth_utils.get_current_admin_user] = lambda: User(id=9, username="admin", role="administrador")
+    return TestClient(app)
+
+
+def _partes():
+    base = os.path.join(archive.ARCHIVE_DIR, "registros")
+    return sorted(
+        os.path.join(d, f) for d in os.listdir(base) if os.path.isdir(os.path.join(base, d))
+        for f in os.listdir(os.path.join(base, d)) if f.endswith(".parquet")
+    )
+
+
+def _exportar(client, **params):
+    r = client.get("/exportar_registros", params=params)
+    assert r.status_code == 200
+    return list(csv.DictReader(io.StringIO(r.text)))
+
+
+# --- Job ---
+def test_archiva_un_parquet_por_mes(db):
+    meses = []
+    total = archive.archivar_registros(db, CORTE, on_mes=lambda mes, n: meses.append((mes, n)))
+
+    assert total == len(ARCHIVABLES)
+    assert meses == [("2023-01", 1), ("2023-02", 3), ("2023-11", 1)]
+    assert [os.path.dirname(p) for p in _partes()] == ["anio_mes=2023-01", "anio_mes=2023-02", "anio_mes=2023-11"]
+    assert sorted(r.key for r in db.query(Registro)) == ["f3", "g0"]
+    assert sorted(r.key for r in db.query(RegistroArchivado)) == ARCHIVABLES
+    assert archive.leer_corte() == CORTE
+
+    fila = archive.leer_registros_archivados(2)[0]
+    assert fila["key"] == "b5" and fila["image"] == "img-b5"
+
+
+def test_segunda_corrida_compacta_el_mes(db):
+    archive.archivar_registros(db, date(2023, 2, 10))
+    db.add(_registro("a0", 1, date(2023, 2, 1)))
+    db.commit()
+    archive.archivar_registros(db, CORTE)
+
+    assert [os.path.dirname(p) for p in _partes()] == ["anio_mes=2023-01", "anio_mes=2023-02", "anio_mes=2023-11"]
+    assert [f["key"] for f in archive.leer_archivo(columnas=["key"], desde=date(2023, 2, 1), hasta=date(2023, 2, 28))] == \
+        ["a0", "a1", "b5", "d2"]
+
+
+def test_filtros_de_lectura(db):
+    archive.archivar_registros(db, CORTE)
+
+    assert [f["key"] for f in archive.leer_archivo(columnas=["key"])] == ["c9", "a1", "b5", "d2", "e7"]
+    assert archive.leer_archivo(columnas=["precision"], user_id=2) == [{"precision": 0.9}, {"precision": 0.9}]
+    assert [f["key"] for f in archive.leer_archivo(
+        columnas=["key"], desde=date(2023, 2, 10), hasta=date(2023, 11, 30))] == ["d2", "e7"]
+    assert archive.leer_archivo(
+        columnas=["key", "inference_date"], desde=date(2023, 2, 1), hasta=date(2023, 2, 28), user_id=1
+    ) == [{"key": "a1", "inference_date": date(2023, 2, 7)}]
+    with pytest.raises(ValueError):
+        archive.leer_archivo(columnas=["image"])
+
+
+def test_sin_archive_dir(db, client, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", "")
+    assert not archive.abarca_archivo(None)
+    assert archive.leer_archivo() == []
+    with pytest.raises(RuntimeError):
+        archive.archivar_registros(db, CORTE)
+    assert db.query(Registro).count() == len(FECHAS)
+    assert len(client.get("/mis_registros").json()) == 5
+
+
+# --- Endpoints ---
+def test_mis_registros_lee_el_archivo(db, client):
+    archive.archivar_registros(db, CORTE)
+
+    filas = {f["key"]: f for f in client.get("/mis_registros").json()}
+    assert sorted(filas) == ["a1", "c9", "e7", "f3", "g0"]
+    assert filas["a1"]["image"] == "img-a1"
+    assert filas["a1"]["inference_date"] == "2023-02-07"
+
+
+def test_registros_por_radiologo_mismo_orden_con_archivo(db, client):
+    antes = [f["key"] for f in client.get("/registros_por_radiologo/1").json()]
+    archive.archivar_registros(db, CORTE)
+    despues = [f["key"] for f in client.get("/registros_por_radiologo/1").json()]
+
+    # Postgres con DESC: nulos primero
+    assert antes[0] == "g0"
+    assert despues == antes
+
+
+def test_bd_gana_sobre_el_archivo(db, client):
+    archive.archivar_registros(db, CORTE)
+    # Mismo key en BD y archivo (p. ej. job cortado antes de borrar)
+    db.add(_registro("a1", 1, date(2023, 2, 7), feedback="nuevo"))
+    db.commit()
+
+    mios = [f for f in client.get("/mis_registros").json() if f["key"] == "a1"]
+    assert [f["feedback"] for f in mios] == ["nuevo"]
+
+    exportados = [f for f in _exportar(client) if f["key"] == "a1"]
+    assert [f["feedback"] for f in exportados] == ["nuevo"]
+
+
+def test_guardar_registro_rechaza_keys_archivadas(db, client):
+    archive.archivar_registros(db, CORTE)
+    body = {
+        "inference_date": "2025-03-01", "birth_date": "1990-01-01", "gender": "F", "city": "Quito",
+        "parish": "p", "canton": "c", "precision": 0.5, "resultados": "{}", "feedback": "", "image": "x",
+    }
+
+    r = client.post("/guardar_registro", json={"key": "a1", **body})
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Registro ya existe"
+    assert client.post("/guardar_registro", json={"key": "z1", **body}).status_code == 200
+
+
+def test_exportar_registros(db, client, monkeypatch):
+    antes = _exportar(client)
+    archive.archivar_registros(db, CORTE)
+    filas = _exportar(client)
+
+    # (inference_date, key), nulos al final; igual que antes de archivar
+    assert [f["key"] for f in filas] == ["c9", "a1", "b5", "d2", "e7", "f3", "g0"]
+    assert filas == antes
+    assert list(filas[0]) == archive.COLUMNAS
+
+    assert _exportar(client, columnas="precision, city", desde="2023-02-01", hasta="2023-02-28") == \
+        [{"precision": "0.9", "city": "Quito"}] * 3
+
+    r = client.get("/exportar_registros", params={"columnas": "key,image"})
+    assert r.status_code == 400
+
+    # desde >= corte: no se abre el archivo
+    def no_leer(*args, **kwargs):
+        raise AssertionError("no debía leer el archivo")
+    monkeypatch.setattr(archive, "iterar_archivo", no_leer)
+    assert [f["key"] for f in _exportar(client, desde="2024-01-01")] == ["f3"]
+
+
+# --- Fallas a mitad del job ---
+def test_job_interrumpido_no_pierde_registros(db, client, monkeypatch):
+    escribir = archive._escribir_mes
+    llamadas = []
+
+    def falla_en_el_segundo_mes(*args):
+        llamadas.append(args)
+        if len(llamadas) == 2:
+            raise OSError("disco lleno")
+        return escribir(*args)
+
+    monkeypatch.setattr(archive, "_escribir_mes", falla_en_el_segundo_mes)
+    with pytest.raises(OSError):
+        archive.archivar_registros(db, CORTE)
+    db.rollback()
+
+    assert archive.leer_corte() == CORTE
+    assert db.query(Registro).count() == len(FECHAS) - 1
+    assert sorted(f["key"] for f in client.get("/mis_registros").json()) == ["a1", "c9", "e7", "f3", "g0"]
+    assert sorted(f["key"] for f in _exportar(client)) == sorted(FECHAS)
+
+
+def test_job_cortado_entre_parquet_y_borrado(db, client, monkeypatch):
+    # El Parquet se escribe pero el commit del borrado falla: los registros
+    # quedan en BD y archivo, y se leen una sola vez.
+    commit = db.commit
+    estado = {"fallar": True}
+
+    def commit_que_falla():
+        if estado["fallar"]:
+            estado["fallar"] = False
+            raise RuntimeError("conexión perdida")
+        commit()
+
+    monkeypatch.setattr(db, "commit", commit_que_falla)
+    with pytest.raises(RuntimeError):
+        archive.archivar_registros(db, CORTE)
+    db.rollback()
+    assert [f["key"] for f in _exportar(client)] == ["c9", "a1", "b5", "d2", "e7", "f3", "g0"]
+
+    archive.archivar_registros(db, CORTE)
+    assert len(_partes()) == 3
+    assert [f["key"] for f in archive.leer_archivo(columnas=["key"])] == ["c9", "a1", "b5", "d2", "e7"]
+    assert [f["key"] for f in _exportar(client)] == ["c9", "a1", "b5", "d2", "e7", "f3", "g0"]
+
+
+def test_corte_nuevo_se_guarda_antes_de_borrar(db, client, monkeypatch):
+    archive.archivar_registros(db, date(2023, 2, 1))
+    assert archive.leer_corte() == date(2023, 2, 1)
+
+    escribir = archive._escribir_mes
+    llamadas = []
+
+    def falla_en_el_segundo_mes(*args):
+        llamadas.append(args)
+        if len(llamadas) == 2:
+            raise OSError("x")
+        return escribir(*args)
+
+    monkeypatch.setattr(archive, "_escribir_mes", falla_en_el_segundo_mes)
+    with pytest.raises(OSError):
+        archive.archivar_registros(db, CORTE)
+    db.rollback()
+
+    assert archive.leer_corte() == CORTE
+    # Febrero ya se movió con el corte nuevo: desde entre ambos cortes lo incluye
+    assert [f["key"] for f in _exportar(client, desde="2023-02-01", hasta="2023-02-28")] == ["a1", "b5", "d2"]
+
+    # Un corte más viejo no retrocede el guardado
+    archive._guardar_corte(date(2022, 1, 1))
+    assert archive.leer_corte() == CORTE